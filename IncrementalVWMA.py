@@ -0,0 +1,33 @@
+from AlgorithmImports import *
+from collections import deque
+
+class IncrementalVWMA(PythonIndicator):
+    """
+    Volume Weighted Moving Average kept as running price*volume and volume sums,
+    so each bar is an O(1) update instead of a re-sum over the whole window.
+    """
+    def __init__(self, name, period):
+        super().__init__()
+        self.name = name
+        self.value = 0
+        self.warm_up_period = period
+        self.window = deque(maxlen=period)
+        self.sum_pv = 0.0
+        self.sum_v = 0.0
+
+    def update(self, input):
+        """Adds the incoming bar and drops the outgoing one. Returns True once the window is full."""
+        volume = input.volume
+        pv = input.close * volume
+
+        if len(self.window) == self.window.maxlen:
+            old_pv, old_v = self.window[0]
+            self.sum_pv -= old_pv
+            self.sum_v -= old_v
+        self.window.append((pv, volume))
+        self.sum_pv += pv
+        self.sum_v += volume
+
+        if self.sum_v > 0:
+            self.value = self.sum_pv / self.sum_v
+        return len(self.window) == self.window.maxlen
@@ -1,6 +1,9 @@
 from AlgorithmImports import *
 from QuantConnect.Orders import *
 from datetime import timedelta
+import numpy as np
+from spread_search import CHAIN_DTYPE, find_bull_put, find_bull_call
+from IncrementalVWMA import IncrementalVWMA
 
 class SymbolManager:
     """
@@ -11,117 +14,109 @@ class SymbolManager:
         self.algorithm = algorithm
         self.symbol = algorithm.add_equity(symbol_str, Resolution.HOUR).symbol
         self.spread_width = spread_width
+        # Short strikes further than this from the underlying can't form a useful spread
+        self.strike_band = spread_width * 3
         
         option = algorithm.add_option(symbol_str, Resolution.MINUTE)
         option.set_filter(lambda u: u.weeklys_only().expiration(timedelta(min_dte), timedelta(max_dte)))
         self.option_symbol = option.symbol
 
-        self.vwma_slow = algorithm.vwma(self.symbol, slow_period, Resolution.HOUR)
-        self.vwma_fast = algorithm.vwma(self.symbol, fast_period, Resolution.HOUR)
+        self.vwma_slow = IncrementalVWMA(f"{symbol_str} VWMA({slow_period})", slow_period)
+        self.vwma_fast = IncrementalVWMA(f"{symbol_str} VWMA({fast_period})", fast_period)
+        algorithm.register_indicator(self.symbol, self.vwma_slow, Resolution.HOUR)
+        algorithm.register_indicator(self.symbol, self.vwma_fast, Resolution.HOUR)
+
+    def warm_up(self):
+        """Seeds the instrument's hourly VWMAs from history."""
+        self.algorithm.warm_up_indicator(self.symbol, self.vwma_slow, Resolution.HOUR)
+        self.algorithm.warm_up_indicator(self.symbol, self.vwma_fast, Resolution.HOUR)
 
     def is_trend_aligned(self):
         """Checks if the instrument's own hourly trend is bullish (V1 Logic)."""
         if not self.vwma_fast.is_ready: return False
         return self.vwma_fast.current.value > self.vwma_slow.current.value
 
-    def attempt_trade_entry(self, allocation_per_trade, slice, margin_per_spread):
+    def attempt_trade_entry(self, cash_per_trade, slice, margin_per_spread):
         """
         Searches for the best bullish spread (Call Debit or Put Credit)
         that meets the 1:1 risk/reward criteria.
         """
         if not self.is_trend_aligned(): return
 
-        underlying_price = self.algorithm.securities[self.symbol].price
         option_chain = slice.option_chains.get(self.option_symbol)
         if not option_chain: return
+        underlying_price = self.algorithm.securities[self.symbol].price
 
-        # --- Search for the best Bull Put Spread (Credit) ---
-        best_put_spread = self.find_best_bull_put_spread(option_chain)
-
-        # --- Search for the best Bull Call Spread (Debit) ---
-        best_call_spread = self.find_best_bull_call_spread(option_chain, underlying_price)
-
-        # --- Decision Logic ---
-        # Prioritize the Put Credit Spread if both are found
-        if best_put_spread:
-            self.execute_spread_trade(best_put_spread['short'], best_put_spread['long'], allocation_per_trade, margin_per_spread)
-        elif best_call_spread:
-            self.execute_spread_trade(best_call_spread['short'], best_call_spread['long'], allocation_per_trade, margin_per_spread)
-        else:
-            self.algorithm.log("No suitable spread found meeting the 1:1 risk/reward criteria.")
-
-    def find_best_bull_put_spread(self, option_chain):
+        # Prioritize the Put Credit Spread; the call side is only scanned when no put spread qualifies
+        if self.attempt_bull_put_entry(option_chain, underlying_price, cash_per_trade, margin_per_spread): return
+        if self.attempt_bull_call_entry(option_chain, underlying_price, cash_per_trade, margin_per_spread): return
+        self.algorithm.log("No suitable spread found meeting the 1:1 risk/reward criteria.")
+
+    def attempt_bull_put_entry(self, option_chain, underlying_price, cash_per_trade, margin_per_spread):
+        """Enters the best Bull Put Spread (Credit), returning False if none qualifies."""
+        puts, chain_data = self.extract_chain_side(option_chain, OptionRight.PUT, underlying_price, underlying_price + self.strike_band)
+        best_put_spread = self.find_best_bull_put_spread(puts, chain_data)
+        if not best_put_spread: return False
+        self.execute_spread_trade(best_put_spread['short'], best_put_spread['long'], cash_per_trade, margin_per_spread)
+        return True
+
+    def attempt_bull_call_entry(self, option_chain, underlying_price, cash_per_trade, margin_per_spread):
+        """Enters the best Bull Call Spread (Debit), returning False if none qualifies."""
+        calls, chain_data = self.extract_chain_side(option_chain, OptionRight.CALL, underlying_price, underlying_price) # Must be ITM
+        best_call_spread = self.find_best_bull_call_spread(calls, chain_data, underlying_price)
+        if not best_call_spread: return False
+        self.execute_spread_trade(best_call_spread['short'], best_call_spread['long'], cash_per_trade, margin_per_spread)
+        return True
+
+    def extract_chain_side(self, option_chain, right, underlying_price, high_strike):
+        """
+        Collects one side of the chain and its per-contract scalars as a CHAIN_DTYPE array,
+        keeping strikes between the band below the underlying (plus one width for long legs) and high_strike.
+        """
+        low_strike = underlying_price - self.strike_band - self.spread_width
+        contracts, rows = [], []
+        for c in option_chain:
+            if c.right != right: continue
+            if not low_strike <= c.strike <= high_strike: continue
+            contracts.append(c)
+            rows.append((c.strike, c.bid_price, c.ask_price, c.expiry.toordinal()))
+        return contracts, np.array(rows, dtype=CHAIN_DTYPE)
+
+    def find_best_bull_put_spread(self, puts, chain_data):
         """Finds the furthest OTM Bull Put Spread with >= 50% credit."""
-        candidate_spreads = []
-        target_credit = self.spread_width * 0.5
-
-        puts = [c for c in option_chain if c.right == OptionRight.PUT]
-        
-        for short_leg in puts:
-            if short_leg.bid_price <= 0: continue
-            
-            long_strike = short_leg.strike - self.spread_width
-            long_leg_candidates = [c for c in puts if c.strike == long_strike and c.expiry == short_leg.expiry]
-            
-            if long_leg_candidates:
-                long_leg = long_leg_candidates[0]
-                if long_leg.ask_price <= 0: continue
-
-                net_credit = short_leg.bid_price - long_leg.ask_price
-                if net_credit >= target_credit:
-                    candidate_spreads.append({'short': short_leg, 'long': long_leg, 'strike': short_leg.strike})
-        
-        if not candidate_spreads: return None
-        # Return the one with the lowest strike (furthest OTM)
-        return sorted(candidate_spreads, key=lambda x: x['strike'])[0]
+        if len(chain_data) == 0: return None
+        short_idx, long_idx = find_bull_put(chain_data, self.spread_width)
+        if short_idx < 0: return None
+        return {'short': puts[short_idx], 'long': puts[long_idx]}
 
-    def find_best_bull_call_spread(self, option_chain, underlying_price):
+    def find_best_bull_call_spread(self, calls, chain_data, underlying_price):
         """Finds the deepest ITM Bull Call Spread with <= 50% debit."""
-        candidate_spreads = []
-        target_debit = self.spread_width * 0.5
-        
-        calls = [c for c in option_chain if c.right == OptionRight.CALL and c.strike < underlying_price] # Must be ITM
-
-        for short_leg in calls:
-            if short_leg.bid_price <= 0: continue
-
-            long_strike = short_leg.strike - self.spread_width
-            long_leg_candidates = [c for c in calls if c.strike == long_strike and c.expiry == short_leg.expiry]
-
-            if long_leg_candidates:
-                long_leg = long_leg_candidates[0]
-                if long_leg.ask_price <= 0: continue
+        if len(chain_data) == 0: return None
+        short_idx, long_idx = find_bull_call(chain_data, self.spread_width, underlying_price)
+        if short_idx < 0: return None
+        return {'short': calls[short_idx], 'long': calls[long_idx]}
 
-                # For a Bull Call Spread, we BUY the lower strike and SELL the higher strike
-                net_debit = long_leg.ask_price - short_leg.bid_price
-                if 0 < net_debit <= target_debit:
-                    candidate_spreads.append({'short': short_leg, 'long': long_leg, 'strike': short_leg.strike})
-
-        if not candidate_spreads: return None
-        # Return the one with the highest strike (deepest ITM)
-        return sorted(candidate_spreads, key=lambda x: x['strike'], reverse=True)[0]
-
-    def execute_spread_trade(self, short_leg, long_leg, allocation, margin):
+    def execute_spread_trade(self, short_leg, long_leg, cash_per_trade, margin):
         """Calculates size and submits orders for the chosen spread."""
         if margin <= 0: return
         
-        max_contracts = (self.algorithm.portfolio.total_portfolio_value * allocation) / margin
+        max_contracts = cash_per_trade / margin
         if max_contracts < 1: return
         quantity = int(max_contracts)
 
-        tag = str(short_leg.symbol)
-        if tag in self.algorithm.pending_entry_symbols: return
-
-        # For Bull Call, we BUY long and SELL short
-        if short_leg.right == OptionRight.CALL:
-             self.algorithm.limit_order(long_leg.symbol, quantity, long_leg.ask_price, tag=tag)
-             self.algorithm.limit_order(short_leg.symbol, -quantity, short_leg.bid_price, tag=tag)
-             self.algorithm.log(f"Submitted Bull Call Spread entry for {short_leg.symbol.value}")
-        # For Bull Put, we SELL short and BUY long
-        else:
-             self.algorithm.limit_order(short_leg.symbol, -quantity, short_leg.bid_price, tag=tag)
-             self.algorithm.limit_order(long_leg.symbol, quantity, long_leg.ask_price, tag=tag)
-             self.algorithm.log(f"Submitted Bull Put Spread entry for {short_leg.symbol.value}")
-             
-        self.algorithm.pending_entry_symbols.add(tag)
+        short_symbol = short_leg.symbol
+        if short_symbol in self.algorithm.pending_entry_symbols: return
+        tag = short_symbol.value
+
+        # Both legs go out as one combo; leg quantities are per-spread ratios.
+        # Net price is a debit for a Bull Call and negative (a credit) for a Bull Put.
+        legs = [Leg.create(short_symbol, -1), Leg.create(long_leg.symbol, 1)]
+        net_price = round(long_leg.ask_price - short_leg.bid_price, 2)
+        self.algorithm.combo_limit_order(legs, quantity, net_price, tag=tag)
+
+        spread_type = "Bull Call" if short_leg.right == OptionRight.CALL else "Bull Put"
+        self.algorithm.log(f"Submitted {spread_type} Spread entry for {short_symbol.value} at net {net_price:.2f}")
+
+        self.algorithm.pending_entry_symbols.add(short_symbol)
+        self.algorithm.tag_to_symbol[tag] = short_symbol
 
@@ -1,7 +1,9 @@
 #region imports
 from AlgorithmImports import *
 from SymbolManager import SymbolManager
+from IncrementalVWMA import IncrementalVWMA
 from datetime import timedelta
+import numpy as np
 #endregion
 
 class VwmaCrossoverStrategy(QCAlgorithm):
@@ -50,183 +52,251 @@ class VwmaCrossoverStrategy(QCAlgorithm):
         self.bear_manager = SymbolManager(self, self.bear_etf, self.min_dte, self.max_dte, self.instrument_slow_period, self.instrument_fast_period, self.spread_width)
 
         # --- Regime Indicator Setup ---
-        self.soxx_vwma_slow = self.vwma(self.soxx, self.regime_slow_period, Resolution.HOUR)
-        self.soxx_vwma_fast = self.vwma(self.soxx, self.regime_fast_period, Resolution.HOUR)
+        self.soxx_vwma_slow = IncrementalVWMA(f"{self.regime_etf} VWMA({self.regime_slow_period})", self.regime_slow_period)
+        self.soxx_vwma_fast = IncrementalVWMA(f"{self.regime_etf} VWMA({self.regime_fast_period})", self.regime_fast_period)
+        self.register_indicator(self.soxx, self.soxx_vwma_slow, Resolution.HOUR)
+        self.register_indicator(self.soxx, self.soxx_vwma_fast, Resolution.HOUR)
         self.soxx_adx = self.adx(self.soxx, self.regime_adx_period, Resolution.HOUR)
 
         # --- State Tracking ---
+        # Open spreads live in slot-indexed parallel arrays; open_spreads maps short leg Symbol -> slot
         self.open_spreads = {}
-        self.pending_entry_symbols = set()
-        self.pending_fills = {} # Tracks partially filled spreads
+        self.spread_short_legs = [None] * self.max_concurrent_trades
+        self.spread_long_legs = [None] * self.max_concurrent_trades
+        self.spread_net_costs = np.zeros(self.max_concurrent_trades)
+        self.spread_expiries = np.full(self.max_concurrent_trades, np.inf) # Expiry date ordinal, inf marks a free slot
+        self.free_spread_slots = list(range(self.max_concurrent_trades - 1, -1, -1))
+        self.pending_entry_symbols = set() # Short leg Symbols of spreads awaiting entry fills
+        self.tag_to_symbol = {} # Order tag (short leg ticker) -> short leg Symbol, filled in at entry submission
+        self.pending_fills = {} # First leg fill event of partially filled spreads, keyed by short leg Symbol
         self.last_trade_date = None
 
-        self.set_warm_up(timedelta(days=self.regime_slow_period + 5))
-        self.last_execution_time = self.time
+        # --- Indicator Warm-Up (seeded from history rather than replaying bars through the engine) ---
+        self.warm_up_indicator(self.soxx, self.soxx_vwma_slow, Resolution.HOUR)
+        self.warm_up_indicator(self.soxx, self.soxx_vwma_fast, Resolution.HOUR)
+        self.warm_up_indicator(self.soxx, self.soxx_adx, Resolution.HOUR)
+        self.bull_manager.warm_up()
+        self.bear_manager.warm_up()
 
-    def on_data(self, slice: Slice):
-        """Main event handler, throttled to run once per hour."""
-        if self.time < self.last_execution_time + timedelta(hours=1):
-            return
-        self.last_execution_time = self.time
-        
-        if self.is_warming_up: return
+        # --- Hourly Execution (first minute after the open, then on the hour) ---
+        self.schedule.on(self.date_rules.every_day(self.soxx), self.time_rules.after_market_open(self.soxx, 1), self.scheduled_execute)
+        self.schedule.on(self.date_rules.every_day(self.soxx), self.time_rules.every(timedelta(hours=1)), self.scheduled_execute)
+
+    def scheduled_execute(self):
+        """Scheduled event handler, runs the strategy once per market hour."""
+        if not self.is_market_open(self.soxx): return
+
+        slice = self.current_slice
+        if slice is None: return
         
         self.execute_strategy(slice)
 
     def execute_strategy(self, slice: Slice):
         """Main logic for managing trades and finding new ones."""
-
-        if self.open_spreads:
-            for short_leg_symbol_str, trade_data in list(self.open_spreads.items()):
-                self.check_roll_condition(SymbolCache.get_symbol(short_leg_symbol_str))
-
-        if self.last_trade_date == self.time.date(): return
-
-        if len(self.open_spreads) + len(self.pending_entry_symbols) < self.max_concurrent_trades:
-            if not self.soxx_adx.is_ready or not self.soxx_vwma_fast.is_ready: return
-            adx_value = self.soxx_adx.current.value
-            if adx_value < self.adx_trend_threshold: return
-
-            soxx_daily_bull = self.soxx_vwma_fast.current.value > self.soxx_vwma_slow.current.value
-            
-            manager = self.bull_manager if soxx_daily_bull else self.bear_manager
-            margin_per_spread = self.spread_width * 100
-            manager.attempt_trade_entry(self.allocation_per_trade, slice, margin_per_spread)
-
-    def check_roll_condition(self, short_leg_symbol):
-        option_security = self.securities.get(short_leg_symbol)
-        if not option_security or not option_security.symbol.underlying: return
-
-        underlying_price = self.securities[option_security.symbol.underlying].price
+        today = self.time.date()
+        open_spreads = self.open_spreads
+
+        if open_spreads:
+            # Days to expiry for every slot at once; free slots stay at inf. Option expiry is midnight of the
+            # expiry date, so (expiry - self.time).days during market hours is one less than the date difference
+            dte = self.spread_expiries - today.toordinal() - 1
+            to_roll = []
+            for slot in np.flatnonzero(dte <= self.roll_days_trigger):
+                short_leg_symbol = self.spread_short_legs[slot]
+                if self.check_roll_condition(short_leg_symbol, int(dte[slot])):
+                    to_roll.append(short_leg_symbol)
+            # Market orders can fill synchronously and drop entries from open_spreads, so liquidate after the scan
+            for short_leg_symbol in to_roll:
+                self.liquidate_spread(short_leg_symbol)
+
+        if self.last_trade_date == today: return
+
+        # At capacity there is nothing to enter, so skip the indicator reads entirely
+        slots = self.max_concurrent_trades - len(open_spreads) - len(self.pending_entry_symbols)
+        if slots <= 0: return
+
+        if not self.soxx_adx.is_ready or not self.soxx_vwma_fast.is_ready: return
+        adx_value = self.soxx_adx.current.value
+        if adx_value < self.adx_trend_threshold: return
+
+        fast = self.soxx_vwma_fast.current.value
+        slow = self.soxx_vwma_slow.current.value
+        soxx_daily_bull = fast > slow
         
-        is_itm = underlying_price <= option_security.symbol.id.strike_price
-        dte = (option_security.expiry - self.time).days
+        manager = self.bull_manager if soxx_daily_bull else self.bear_manager
+        margin_per_spread = self.spread_width * 100
+        cash_per_trade = self.portfolio.total_portfolio_value * self.allocation_per_trade
+        manager.attempt_trade_entry(cash_per_trade, slice, margin_per_spread)
+
+    def check_roll_condition(self, short_leg_symbol, dte):
+        """Returns True when the short leg of a spread inside the roll window is ITM."""
+        underlying_security = self.securities.get(short_leg_symbol.underlying)
+        if not underlying_security: return False
 
-        if is_itm and dte <= self.roll_days_trigger:
+        if underlying_security.price <= short_leg_symbol.id.strike_price:
             self.log(f"ROLL TRIGGER: Spread at {short_leg_symbol.value} is ITM with {dte} DTE. Liquidating.")
-            self.liquidate_spread(short_leg_symbol)
+            return True
+        return False
+
+    def add_open_spread(self, short_leg_symbol, long_leg_symbol, net_cost):
+        """Stores a newly opened spread in a free slot of the spread arrays."""
+        if not self.free_spread_slots:
+            # Capacity is checked before every entry, so this is a bookkeeping bug; never leave the legs unmanaged
+            self.error(f"No free spread slot for {short_leg_symbol.value}. Flattening both legs.")
+            # Untagged orders so the closing fills are not routed back into the entry handler
+            self.tag_to_symbol.pop(short_leg_symbol.value, None)
+            self.market_order(short_leg_symbol, -self.portfolio[short_leg_symbol].quantity)
+            self.market_order(long_leg_symbol, -self.portfolio[long_leg_symbol].quantity)
+            return
+
+        slot = self.free_spread_slots.pop()
+        self.open_spreads[short_leg_symbol] = slot
+        self.spread_short_legs[slot] = short_leg_symbol
+        self.spread_long_legs[slot] = long_leg_symbol
+        self.spread_net_costs[slot] = net_cost
+        self.spread_expiries[slot] = self.securities[short_leg_symbol].expiry.toordinal()
+
+    def remove_open_spread(self, short_leg_symbol):
+        """Releases a closed spread's slot."""
+        slot = self.open_spreads.pop(short_leg_symbol)
+        self.spread_short_legs[slot] = None
+        self.spread_long_legs[slot] = None
+        self.spread_net_costs[slot] = 0.0
+        self.spread_expiries[slot] = np.inf
+        self.free_spread_slots.append(slot)
 
     def on_order_event(self, order_event):
         order = self.transactions.get_order_by_id(order_event.order_id)
         if order is None: return
         
-        short_leg_symbol_str = order.tag
-        if not short_leg_symbol_str: return
-
-        if order_event.status in [OrderStatus.CANCELED, OrderStatus.INVALID]:
-            if short_leg_symbol_str in self.pending_entry_symbols:
-                self.pending_entry_symbols.remove(short_leg_symbol_str)
-            if short_leg_symbol_str in self.pending_fills:
-                del self.pending_fills[short_leg_symbol_str]
+        tag = order.tag
+        if not tag: return
+        short_leg_symbol = self.tag_to_symbol.get(tag)
+        if short_leg_symbol is None: return
+
+        status = order_event.status
+        if status == OrderStatus.CANCELED or status == OrderStatus.INVALID:
+            self.pending_entry_symbols.discard(short_leg_symbol)
+            self.pending_fills.pop(short_leg_symbol, None)
+            if short_leg_symbol not in self.open_spreads:
+                # Spread never opened or is already closed, so no live order carries this tag anymore
+                self.tag_to_symbol.pop(tag, None)
             return
 
-        if order_event.status != OrderStatus.FILLED: return
-
-        is_entry_order = short_leg_symbol_str in self.pending_entry_symbols
-        is_exit_order = short_leg_symbol_str in self.open_spreads
-
-        if is_entry_order:
-            self.handle_spread_entry_fill(order)
-        elif is_exit_order:
-            self.handle_spread_exit_fill(short_leg_symbol_str)
-
-    def handle_spread_entry_fill(self, order):
-        """Robustly handles the filling of spread legs."""
-        short_leg_symbol_str = order.tag
-        
-        if short_leg_symbol_str in self.pending_fills:
-            partial_fill_data = self.pending_fills.pop(short_leg_symbol_str)
-            first_leg_order = partial_fill_data['order']
-            
-            # Determine which leg is which
-            is_call_spread = first_leg_order.symbol.id.option_right == OptionRight.CALL
+        if status != OrderStatus.FILLED: return
+
+        if short_leg_symbol in self.pending_entry_symbols:
+            self.handle_spread_entry_fill(order_event, short_leg_symbol)
+        elif short_leg_symbol in self.open_spreads:
+            self.handle_spread_exit_fill(short_leg_symbol)
+
+    def handle_spread_entry_fill(self, order_event, short_leg_symbol):
+        """
+        Robustly handles the filling of spread legs. The entry combo fills each leg
+        as its own order, so the first leg's fill event is held until the second arrives.
+        """
+        first_leg_fill = self.pending_fills.pop(short_leg_symbol, None)
+        if first_leg_fill is not None:
+            # Determine which leg is which; the short leg is always the sell side
+            if order_event.direction == OrderDirection.SELL:
+                short_fill, long_fill = order_event, first_leg_fill
+            else:
+                short_fill, long_fill = first_leg_fill, order_event
+            is_call_spread = first_leg_fill.symbol.id.option_right == OptionRight.CALL
             
             if is_call_spread:
-                long_order = order if order.direction == OrderDirection.BUY else first_leg_order
-                short_order = order if order.direction == OrderDirection.SELL else first_leg_order
-                net_debit = long_order.price - short_order.price
+                net_debit = long_fill.fill_price - short_fill.fill_price
                 
-                # Using short leg string as key
-                self.open_spreads[str(short_order.symbol)] = {
-                    'net_cost': net_debit,
-                    'long_leg_symbol_str': str(long_order.symbol)
-                }
-                self.log(f"Bull Call Spread opened: {short_order.symbol}. Net Debit: ${net_debit:.2f}")
+                self.add_open_spread(short_fill.symbol, long_fill.symbol, net_debit)
+                self.log(f"Bull Call Spread opened: {short_fill.symbol.value}. Net Debit: ${net_debit:.2f}")
 
             else: # It's a Put Spread
-                short_order = order if order.direction == OrderDirection.SELL else first_leg_order
-                long_order = order if order.direction == OrderDirection.BUY else first_leg_order
-                net_credit = short_order.price - long_order.price
+                net_credit = short_fill.fill_price - long_fill.fill_price
 
                 if net_credit <= 0:
-                    self.liquidate_spread(short_order.symbol)
+                    self.liquidate_spread(short_fill.symbol)
                     return
                 
-                self.open_spreads[str(short_order.symbol)] = {
-                    'net_cost': -net_credit, # Store as negative for consistency
-                    'long_leg_symbol_str': str(long_order.symbol)
-                }
-                self.log(f"Bull Put Spread opened: {short_order.symbol}. Net Credit: ${net_credit:.2f}")
+                self.add_open_spread(short_fill.symbol, long_fill.symbol, -net_credit) # Store credit as negative for consistency
+                self.log(f"Bull Put Spread opened: {short_fill.symbol.value}. Net Credit: ${net_credit:.2f}")
 
-            self.pending_entry_symbols.remove(short_leg_symbol_str)
+            self.pending_entry_symbols.remove(short_fill.symbol)
             self.last_trade_date = self.time.date()
-            self.set_spread_profit_taker(str(short_order.symbol))
+            self.set_spread_profit_taker(short_fill.symbol)
 
         else:
-            self.pending_fills[short_leg_symbol_str] = {'order': order}
+            self.pending_fills[short_leg_symbol] = order_event
 
-    def set_spread_profit_taker(self, short_leg_symbol_str):
-        """Creates GTC limit orders to close the spread at a profit."""
-        if short_leg_symbol_str not in self.open_spreads: return
+    def set_spread_profit_taker(self, short_leg_symbol):
+        """Creates a GTC combo limit order to close the spread at a profit."""
+        slot = self.open_spreads.get(short_leg_symbol)
+        if slot is None: return
         
-        trade_data = self.open_spreads[short_leg_symbol_str]
-        long_leg_symbol = SymbolCache.get_symbol(trade_data['long_leg_symbol_str'])
-        short_leg_symbol = SymbolCache.get_symbol(short_leg_symbol_str)
-        net_cost = trade_data['net_cost']
+        long_leg_symbol = self.spread_long_legs[slot]
+        tag = short_leg_symbol.value
+        net_cost = self.spread_net_costs[slot]
+        quantity = int(-self.portfolio[short_leg_symbol].quantity) # Combo orders take an int quantity
+
+        # The combo closes both legs by one quantity; an unbalanced spread is closed leg by leg instead
+        if self.portfolio[long_leg_symbol].quantity != quantity:
+            self.log(f"Spread at {tag} has unbalanced legs. Liquidating instead of setting a profit taker.")
+            self.liquidate_spread(short_leg_symbol)
+            return
 
         if net_cost < 0: # Credit Spread
             net_credit = -net_cost
             profit_target_debit = round(net_credit * (1 - self.profit_target_percentage), 2)
             if profit_target_debit < 0.01: profit_target_debit = 0.01
-            
-            # Buy back short, sell long
-            self.limit_order(short_leg_symbol, -self.portfolio[short_leg_symbol].quantity, profit_target_debit, tag=short_leg_symbol_str)
-            self.limit_order(long_leg_symbol, -self.portfolio[long_leg_symbol].quantity, 0.01, tag=short_leg_symbol_str)
+            limit_price = profit_target_debit # Pay at most this net debit
         else: # Debit Spread
             max_profit = self.spread_width - net_cost
             target_credit = round(net_cost + (max_profit * self.profit_target_percentage), 2)
-            
-            # Sell short, sell long
-            self.limit_order(short_leg_symbol, -self.portfolio[short_leg_symbol].quantity, target_credit, tag=short_leg_symbol_str)
-            self.limit_order(long_leg_symbol, -self.portfolio[long_leg_symbol].quantity, 0.01, tag=short_leg_symbol_str)
+            limit_price = -target_credit # Receive at least this net credit
 
-        self.log(f"Submitted profit taker orders for spread {short_leg_symbol_str}.")
+        # Buy back short, sell long as a single combo
+        legs = [Leg.create(short_leg_symbol, 1), Leg.create(long_leg_symbol, -1)]
+        self.combo_limit_order(legs, quantity, limit_price, tag=tag)
 
-    def handle_spread_exit_fill(self, short_leg_symbol_str):
-        """Checks if both legs of a closing spread order have filled."""
-        if short_leg_symbol_str not in self.open_spreads: return
+        self.log(f"Submitted profit taker combo for spread {tag} at net {limit_price:.2f}.")
 
-        trade_data = self.open_spreads[short_leg_symbol_str]
-        long_leg_symbol = SymbolCache.get_symbol(trade_data['long_leg_symbol_str'])
-        short_leg_symbol = SymbolCache.get_symbol(short_leg_symbol_str)
+    def handle_spread_exit_fill(self, short_leg_symbol):
+        """Checks if both legs of the closing combo have filled. Each combo leg reports its own fill."""
+        slot = self.open_spreads.get(short_leg_symbol)
+        if slot is None: return
+
+        long_leg_symbol = self.spread_long_legs[slot]
+        portfolio = self.portfolio
         
-        if not self.portfolio[short_leg_symbol].invested and not self.portfolio[long_leg_symbol].invested:
-            del self.open_spreads[short_leg_symbol_str]
-            self.log(f"Spread at {short_leg_symbol_str} has been closed.")
+        if not portfolio[short_leg_symbol].invested and not portfolio[long_leg_symbol].invested:
+            self.remove_open_spread(short_leg_symbol)
+            self.log(f"Spread at {short_leg_symbol.value} has been closed.")
             self.transactions.cancel_open_orders(short_leg_symbol)
             self.transactions.cancel_open_orders(long_leg_symbol)
+            self.tag_to_symbol.pop(short_leg_symbol.value, None)
 
     def liquidate_spread(self, short_leg_symbol):
-        short_leg_symbol_str = str(short_leg_symbol)
+        tag = short_leg_symbol.value
         
-        if short_leg_symbol_str in self.open_spreads:
-            trade_data = self.open_spreads[short_leg_symbol_str]
-            long_leg_symbol = SymbolCache.get_symbol(trade_data['long_leg_symbol_str'])
-            if self.portfolio[short_leg_symbol].invested:
-                self.market_order(short_leg_symbol, -self.portfolio[short_leg_symbol].quantity, tag=short_leg_symbol_str)
-            if self.portfolio[long_leg_symbol].invested:
-                self.market_order(long_leg_symbol, -self.portfolio[long_leg_symbol].quantity, tag=short_leg_symbol_str)
+        slot = self.open_spreads.get(short_leg_symbol)
+        if slot is not None:
+            long_leg_symbol = self.spread_long_legs[slot]
+            short_holding = self.portfolio[short_leg_symbol]
+            long_holding = self.portfolio[long_leg_symbol]
+
+            # Pull the resting profit taker so it can't also fill against the closing orders
+            self.transactions.cancel_open_orders(short_leg_symbol)
+            self.transactions.cancel_open_orders(long_leg_symbol)
+
+            if short_holding.invested and long_holding.quantity == -short_holding.quantity:
+                legs = [Leg.create(short_leg_symbol, 1), Leg.create(long_leg_symbol, -1)]
+                self.combo_market_order(legs, int(-short_holding.quantity), tag=tag)
+            else:
+                # Single or unbalanced legs are each closed by their own quantity so neither is left open
+                if short_holding.invested:
+                    self.market_order(short_leg_symbol, -short_holding.quantity, tag=tag)
+                if long_holding.invested:
+                    self.market_order(long_leg_symbol, -long_holding.quantity, tag=tag)
         
-        if short_leg_symbol_str in self.pending_entry_symbols:
+        if short_leg_symbol in self.pending_entry_symbols:
              self.transactions.cancel_open_orders(short_leg_symbol)
 
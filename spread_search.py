@@ -0,0 +1,79 @@
+import numpy as np
+from numba import njit
+
+# Per-contract scalars pulled out of the option chain for the spread search
+CHAIN_DTYPE = np.dtype([('strike', 'f8'), ('bid', 'f8'), ('ask', 'f8'), ('expiry', 'i8')])
+
+
+@njit(cache=True)
+def _long_leg_index(strikes, start, i, width):
+    """Index of the contract struck one width below i within the expiry group starting at start, or -1."""
+    target = strikes[i] - width
+    j = start + np.searchsorted(strikes[start:i], target)
+    if j < i and strikes[j] == target:
+        return j
+    return -1
+
+
+@njit(cache=True)
+def _best_bull_put(strikes, bids, asks, expiries, order, width):
+    """Scans a chain side sorted by (expiry, strike) for the lowest-strike put spread with >= 50% credit."""
+    target_credit = width * 0.5
+    best_short, best_long = -1, -1
+    start = 0
+    for i in range(len(strikes)):
+        if i > 0 and expiries[i] != expiries[i - 1]:
+            start = i
+        if bids[i] <= 0:
+            continue
+        j = _long_leg_index(strikes, start, i, width)
+        if j < 0 or asks[j] <= 0:
+            continue
+        if bids[i] - asks[j] < target_credit:
+            continue
+        # Ties on strike go to the contract that came first in the chain
+        if (best_short < 0 or strikes[i] < strikes[best_short]
+                or (strikes[i] == strikes[best_short] and order[i] < order[best_short])):
+            best_short, best_long = i, j
+    return best_short, best_long
+
+
+@njit(cache=True)
+def _best_bull_call(strikes, bids, asks, expiries, order, width, underlying_price):
+    """Scans a chain side sorted by (expiry, strike) for the highest-strike ITM call spread with <= 50% debit."""
+    target_debit = width * 0.5
+    best_short, best_long = -1, -1
+    start = 0
+    for i in range(len(strikes)):
+        if i > 0 and expiries[i] != expiries[i - 1]:
+            start = i
+        if strikes[i] >= underlying_price or bids[i] <= 0:
+            continue
+        j = _long_leg_index(strikes, start, i, width)
+        if j < 0 or asks[j] <= 0:
+            continue
+        net_debit = asks[j] - bids[i]
+        if net_debit <= 0 or net_debit > target_debit:
+            continue
+        if (best_short < 0 or strikes[i] > strikes[best_short]
+                or (strikes[i] == strikes[best_short] and order[i] < order[best_short])):
+            best_short, best_long = i, j
+    return best_short, best_long
+
+
+def find_bull_put(chain_data, width):
+    """Returns (short_idx, long_idx) into chain_data for the best Bull Put Spread, or (-1, -1)."""
+    order = np.lexsort((chain_data['strike'], chain_data['expiry']))
+    data = chain_data[order]
+    i, j = _best_bull_put(data['strike'], data['bid'], data['ask'], data['expiry'], order, width)
+    if i < 0: return -1, -1
+    return order[i], order[j]
+
+
+def find_bull_call(chain_data, width, underlying_price):
+    """Returns (short_idx, long_idx) into chain_data for the best Bull Call Spread, or (-1, -1)."""
+    order = np.lexsort((chain_data['strike'], chain_data['expiry']))
+    data = chain_data[order]
+    i, j = _best_bull_call(data['strike'], data['bid'], data['ask'], data['expiry'], order, width, underlying_price)
+    if i < 0: return -1, -1
+    return order[i], order[j]